@@ -1,23 +1,55 @@
 import os
+import sys
+import functools
 import time
+import wave
 import random
+import pickle
+import shutil
+import hashlib
+import asyncio
+import argparse
+import collections
+import tempfile
 import subprocess
-from gtts import gTTS
-import glob
-import whisper
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+import soundfile as sf
+from scipy.signal import resample_poly
+from piper import PiperVoice
+import ctranslate2
+from faster_whisper import WhisperModel
+
+try:
+    import psutil  # optional: only used to count physical cores
+except ImportError:
+    psutil = None
 
 # --- CONFIG ---
 STORY_FILE = "story.txt"
-TITLE_AUDIO = "title_narration.mp3"
-BODY_AUDIO = "body_narration.mp3"
-OUTPUT_AUDIO = "narration.mp3"
+CACHE_FOLDER = ".cache"          # narration + transcripts, keyed by a hash of the story text
+TITLE_AUDIO = "title_narration.wav"
+BODY_AUDIO = "body_narration.wav"
 SUBTITLE_FILE = "subtitles.ass"  # ASS for karaoke
 IMAGE_FOLDER = "images"
 BACKGROUND_FOLDER = "backgrounds/"
 OUTPUT_VIDEO = "output.mp4"
 OUTPUT_RESOLUTION = "1080:1920"
-OVERLAY_SCALE = "iw*min(864/iw\\,1):ih*min(864/iw\\,1)"
+BG_CROPPED_SUFFIX = ".1080x1920.mp4"  # pre-cropped copy cached next to each background
+OVERLAY_MAX_WIDTH = 864         # title PNG is shrunk (never enlarged) to this width
+OVERLAY_IMAGE = "title_overlay.png"
 OVERLAY_Y_POSITION = "(main_h-overlay_h)/2"
+WHISPER_MODEL = "small.en"
+WHISPER_COMPUTE_TYPE = "int8"    # CTranslate2 int8 kernels, much faster than FP32 on CPU
+WHISPER_DEVICE = "cpu"           # "cpu", "cuda", or "auto" (CUDA when ctranslate2 sees a GPU)
+WHISPER_GPU_COMPUTE_TYPE = "int8_float16"  # used instead when running on CUDA
+WHISPER_SAMPLE_RATE = 16000      # Whisper wants 16 kHz mono float32
+WHISPER_BEAM_SIZE = 1            # greedy, like openai-whisper's transcribe(); clean TTS audio doesn't need beams
+VAD_MIN_SILENCE_MS = 300         # silences longer than this are cut before the encoder runs
+PIPER_VOICE = "voices/en_US-lessac-medium.onnx"  # local Piper voice (.onnx + .onnx.json)
+PIPER_USE_CUDA = False           # set True on GPU boxes (onnxruntime-gpu)
 
 # --- FONT / SUBTITLE TUNING ---
 FONT_FOLDER = "fonts"            # Put Montserrat-ExtraBold.ttf here
@@ -34,17 +66,135 @@ NO_SUBS_BEFORE = 0.05            # seconds after title ends
 
 
 def format_ass_time(seconds: float) -> str:
-    """ASS uses h:mm:ss.cs (centiseconds)"""
-    seconds = max(0.0, seconds)
-    cs = int(round((seconds - int(seconds)) * 100))
-    s = int(seconds) % 60
-    m = (int(seconds) // 60) % 60
-    h = int(seconds) // 3600
-    return f"{h:01}:{m:02}:{s:02}.{cs:02d}"
+    """ASS uses h:mm:ss.cs (centiseconds). Callers guarantee seconds >= 0."""
+    t = int(seconds * 100 + 0.5)  # whole centiseconds, rounded once
+    t, cs = divmod(t, 100)
+    t, s = divmod(t, 60)
+    h, m = divmod(t, 60)
+    return f"{h}:{m:02}:{s:02}.{cs:02}"
+
+
+_PUNCT = frozenset({".", ",", "!", "?", ":", ";", "…", "'", "\"", ")", "]", "}", "—", "-", "–"})
+
+
+def synth(voice, text, out_wav):
+    """Synthesize text to a WAV file with a local Piper voice (piper-tts >= 1.3 API)."""
+    with wave.open(out_wav, "wb") as wav_file:
+        voice.synthesize_wav(text, wav_file)
+
+
+def load_voice():
+    """Load the Piper voice, with a readable error if it hasn't been downloaded yet."""
+    if not os.path.exists(PIPER_VOICE):
+        raise FileNotFoundError(
+            f"Piper voice not found at PIPER_VOICE = {PIPER_VOICE!r} "
+            "(download steps are in requirements.txt)"
+        )
+    return PiperVoice.load(PIPER_VOICE, use_cuda=PIPER_USE_CUDA)
+
+
+def load_audio(path):
+    """Decode audio to the 16 kHz mono float32 array Whisper expects, without spawning ffmpeg."""
+    audio, sr = sf.read(path, dtype="float32", always_2d=False)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sr != WHISPER_SAMPLE_RATE:
+        audio = resample_poly(audio, WHISPER_SAMPLE_RATE, sr)
+    return audio.astype(np.float32, copy=False)
+
 
+# Hardware H.264 encoders to try before falling back to libx264, in order of preference
+HW_ENCODERS = [
+    ("h264_nvenc", ["-c:v", "h264_nvenc", "-preset", "p4", "-rc", "vbr", "-cq", "23"]),
+    ("h264_videotoolbox", ["-c:v", "h264_videotoolbox", "-b:v", "6M"]),
+    ("h264_qsv", ["-c:v", "h264_qsv", "-preset", "veryfast", "-global_quality", "23"]),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def video_encoder_args():
+    """
+    Pick the fastest working H.264 encoder (probed once per process).
+    An encoder being compiled into ffmpeg doesn't mean the hardware is there,
+    so each candidate gets a tiny test encode first.
+    """
+    try:
+        encoders = subprocess.run(["ffmpeg", "-hide_banner", "-encoders"],
+                                  capture_output=True, text=True).stdout
+    except OSError:
+        encoders = ""
+    for name, args in HW_ENCODERS:
+        if name not in encoders:
+            continue
+        probe = ["ffmpeg", "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", "color=black:s=256x256:d=0.1", *args, "-f", "null", "-"]
+        if subprocess.run(probe, capture_output=True).returncode == 0:
+            return args
+    # No explicit -threads: x264's auto threading beats manual counts on SMT machines.
+    # fastdecode makes the output cheaper to decode for the platforms that re-encode it anyway.
+    return ["-c:v", "libx264", "-preset", "veryfast", "-crf", "23", "-tune", "fastdecode"]
+
+
+def cropped_background(bg_video):
+    """
+    Return a 1080x1920 copy of bg_video, encoding it once and reusing it afterwards,
+    so the scale+crop isn't redone on every frame of every render.
+    """
+    cached = os.path.splitext(bg_video)[0] + BG_CROPPED_SUFFIX
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(bg_video):
+        return cached
+
+    print("🎥 Pre-cropping background (one time):", bg_video)
+    tmp = cached + ".part"
+    subprocess.run([
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-i", bg_video,
+        "-vf", "scale=iw*max(1080/iw\\,1920/ih):ih*max(1080/iw\\,1920/ih),crop=1080:1920",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "20",
+        "-an",
+        "-f", "mp4", tmp
+    ], check=True)
+    os.replace(tmp, cached)  # only a finished file ever gets the cached name
+    return cached
+
+
+def prescale_overlay(image_path, out_path):
+    """
+    Shrink the title PNG to OVERLAY_MAX_WIDTH once with Pillow, so ffmpeg
+    doesn't rescale the same static image on every frame. Returns the path to use.
+    """
+    with Image.open(image_path) as im:
+        w, h = im.size
+        if w <= OVERLAY_MAX_WIDTH:
+            return image_path
+        im.resize((OVERLAY_MAX_WIDTH, round(h * OVERLAY_MAX_WIDTH / w)), Image.LANCZOS).save(out_path)
+    return out_path
 
-def _is_punct(token: str) -> bool:
-    return token in {".", ",", "!", "?", ":", ";", "…", "'", "\"", ")", "]", "}", "—", "-", "–"}
+
+def transcribe_words(model, audio):
+    """
+    Transcribe with faster-whisper and return the openai-whisper style dict
+    that save_ass_subs expects: {"segments": [{"start", "end", "text", "words": [...]}]}
+    """
+    segments, _info = model.transcribe(
+        audio,
+        word_timestamps=True,
+        beam_size=WHISPER_BEAM_SIZE,
+        vad_filter=True,  # Silero VAD drops silent stretches; timestamps stay on the original timeline
+        vad_parameters=dict(min_silence_duration_ms=VAD_MIN_SILENCE_MS),
+    )
+    result = {"segments": []}
+    for seg in segments:  # generator: decoding happens while iterating
+        result["segments"].append({
+            "start": seg.start,
+            "end": seg.end,
+            "text": seg.text,
+            "words": [
+                {"start": w.start, "end": w.end, "word": w.word}
+                for w in (seg.words or [])
+            ],
+        })
+    return result
 
 
 def save_ass_subs(result, ass_path, title_duration):
@@ -56,214 +206,462 @@ def save_ass_subs(result, ass_path, title_duration):
       - Black outline around letters
       - Timing offset applied to improve sync
     """
-    with open(ass_path, "w", encoding="utf-8") as f:
-        # Header
-        f.write("[Script Info]\n")
-        f.write("ScriptType: v4.00+\n")
-        f.write("PlayResX: 1080\n")
-        f.write("PlayResY: 1920\n")
-        f.write("WrapStyle: 2\n\n")  # smart wrapping if it happens
-
-        # Styles
-        f.write("[V4+ Styles]\n")
-        f.write("Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, "
-                "OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, "
-                "ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
-                "Alignment, MarginL, MarginR, MarginV, Encoding\n")
-
-        # IMPORTANT (ASS karaoke semantics):
-        # - Highlighted portion uses PrimaryColour
-        # - Unhighlighted portion uses SecondaryColour
-        # We want base white, highlight yellow -> Primary = yellow, Secondary = white.
-        # Color format is &HAABBGGRR (AA = alpha). Use AA=00 for opaque.
-        PRIMARY_YELLOW = "&H00FFFF00"
-        SECONDARY_WHITE = "&H00FFFFFF"
-        OUTLINE_BLACK = "&H00000000"
-        BACK_BLACK = "&H80000000"  # not used (no box), but harmless
-
-        # Centered (5), outlined text
-        f.write(
-            "Style: Default,"
-            f"{FONT_NAME},{FONT_SIZE},"
-            f"{PRIMARY_YELLOW},{SECONDARY_WHITE},{OUTLINE_BLACK},{BACK_BLACK},"
-            "0,0,0,0,100,100,0,0,1,"              # BorderStyle=1 (outline)
-            f"{OUTLINE_SIZE},{SHADOW_SIZE},"
-            "5,10,10,40,0\n\n"                    # Alignment=5 (center), MarginV=40
-        )
+    out = []  # build the whole file in memory, write it once
+    # Header
+    out.append("[Script Info]\n")
+    out.append("ScriptType: v4.00+\n")
+    out.append("PlayResX: 1080\n")
+    out.append("PlayResY: 1920\n")
+    out.append("WrapStyle: 2\n\n")  # smart wrapping if it happens
+
+    # Styles
+    out.append("[V4+ Styles]\n")
+    out.append("Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, "
+               "OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, "
+               "ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+               "Alignment, MarginL, MarginR, MarginV, Encoding\n")
+
+    # IMPORTANT (ASS karaoke semantics):
+    # - Highlighted portion uses PrimaryColour
+    # - Unhighlighted portion uses SecondaryColour
+    # We want base white, highlight yellow -> Primary = yellow, Secondary = white.
+    # Color format is &HAABBGGRR (AA = alpha). Use AA=00 for opaque.
+    PRIMARY_YELLOW = "&H00FFFF00"
+    SECONDARY_WHITE = "&H00FFFFFF"
+    OUTLINE_BLACK = "&H00000000"
+    BACK_BLACK = "&H80000000"  # not used (no box), but harmless
+
+    # Centered (5), outlined text
+    out.append(
+        "Style: Default,"
+        f"{FONT_NAME},{FONT_SIZE},"
+        f"{PRIMARY_YELLOW},{SECONDARY_WHITE},{OUTLINE_BLACK},{BACK_BLACK},"
+        "0,0,0,0,100,100,0,0,1,"              # BorderStyle=1 (outline)
+        f"{OUTLINE_SIZE},{SHADOW_SIZE},"
+        "5,10,10,40,0\n\n"                    # Alignment=5 (center), MarginV=40
+    )
+
+    # Events
+    out.append("[Events]\n")
+    out.append("Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
+
+    for seg in result["segments"]:
+        # Skip anything that ends before or at the title end (raw times, no offset)
+        if seg["end"] <= title_duration:
+            continue
+
+        if "words" not in seg or not seg["words"]:
+            # Fallback: whole segment as one line after title
+            start = max(title_duration + NO_SUBS_BEFORE, seg["start"] + SUB_TIMING_OFFSET)
+            end = max(start + 0.01, seg["end"] + SUB_TIMING_OFFSET)
+            out.append(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{seg['text'].strip()}\n")
+            continue
+
+        words = seg["words"]
+
+        # Chunk into MAX_WORDS_PER_LINE groups
+        for i in range(0, len(words), MAX_WORDS_PER_LINE):
+            chunk = words[i:i + MAX_WORDS_PER_LINE]
+            raw_start = chunk[0]["start"]
+            raw_end = chunk[-1]["end"]
+
+            # Apply timing offset and clamp to avoid title period
+            start = raw_start + SUB_TIMING_OFFSET
+            end = raw_end + SUB_TIMING_OFFSET
+
+            # If (after offset) the line would still end before title finishes, skip it
+            if end <= title_duration:
+                continue
 
-        # Events
-        f.write("[Events]\n")
-        f.write("Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n")
+            # Ensure we don't show anything before title ends
+            start = max(start, title_duration + NO_SUBS_BEFORE, 0.0)
+            end = max(end, start + 0.01)
+
+            # Build karaoke text: each token gets a \k duration (centiseconds)
+            line = []
+            first_token = True
+            for idx, w in enumerate(chunk):
+                dur_cs = max(1, int(round((w["end"] - w["start"]) * 100)))
+                tok = (w.get("word") or "").strip()
+                if not tok:
+                    continue
 
-        for seg in result["segments"]:
-            # Skip anything that ends before or at the title end (raw times, no offset)
-            if seg["end"] <= title_duration:
-                continue
+                # spacing: add a space before non-punctuation tokens (except at line start)
+                if not first_token and tok not in _PUNCT:
+                    line.append(" ")
 
-            if "words" not in seg or not seg["words"]:
-                # Fallback: whole segment as one line after title
-                start = max(title_duration + NO_SUBS_BEFORE, seg["start"] + SUB_TIMING_OFFSET)
-                end = max(start + 0.01, seg["end"] + SUB_TIMING_OFFSET)
-                f.write(f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{seg['text'].strip()}\n")
-                continue
+                line.append(f"{{\\k{dur_cs}}}{tok}")
+                first_token = False
 
-            words = seg["words"]
+            text = "".join(line).strip()
+            if text:
+                out.append(
+                    f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}\n"
+                )
 
-            # Chunk into MAX_WORDS_PER_LINE groups
-            for i in range(0, len(words), MAX_WORDS_PER_LINE):
-                chunk = words[i:i + MAX_WORDS_PER_LINE]
-                raw_start = chunk[0]["start"]
-                raw_end = chunk[-1]["end"]
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("".join(out))
 
-                # Apply timing offset and clamp to avoid title period
-                start = raw_start + SUB_TIMING_OFFSET
-                end = raw_end + SUB_TIMING_OFFSET
 
-                # If (after offset) the line would still end before title finishes, skip it
-                if end <= title_duration:
-                    continue
+# Model loads and TTS synthesis are independent, so they share a small pool
+_pool = ThreadPoolExecutor(max_workers=3)
+_model_future = None
+_voice_future = None
 
-                # Ensure we don't show anything before title ends
-                start = max(start, title_duration + NO_SUBS_BEFORE, 0.0)
-                end = max(end, start + 0.01)
 
-                # Build karaoke text: each token gets a \k duration (centiseconds)
-                line = []
-                first_token = True
-                for idx, w in enumerate(chunk):
-                    dur_cs = max(1, int(round((w["end"] - w["start"]) * 100)))
-                    tok = (w.get("word") or "").strip()
-                    if not tok:
-                        continue
+def physical_cores():
+    """Physical core count; SMT siblings share the int8 GEMM units, so extra threads just contend."""
+    if psutil is not None:
+        return psutil.cpu_count(logical=False) or os.cpu_count()
+    return os.cpu_count()
 
-                    # spacing: add a space before non-punctuation tokens (except at line start)
-                    if not first_token and not _is_punct(tok):
-                        line.append(" ")
 
-                    line.append(f"{{\\k{dur_cs}}}{tok}")
-                    first_token = False
+def whisper_device():
+    """(device, compute_type) for Whisper. GPU is opt-in via WHISPER_DEVICE, like PIPER_USE_CUDA."""
+    if WHISPER_DEVICE == "cuda" or (WHISPER_DEVICE == "auto" and ctranslate2.get_cuda_device_count() > 0):
+        return "cuda", WHISPER_GPU_COMPUTE_TYPE
+    return "cpu", WHISPER_COMPUTE_TYPE
 
-                text = "".join(line).strip()
-                if text:
-                    f.write(
-                        f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Default,,0,0,0,,{text}\n"
-                    )
 
+def load_model_async():
+    """Start loading the Whisper model once per process; later jobs reuse the same future."""
+    global _model_future
+    if _model_future is None:
+        device, compute_type = whisper_device()
+        _model_future = _pool.submit(WhisperModel, WHISPER_MODEL, device=device,
+                                     compute_type=compute_type, cpu_threads=physical_cores())
+    return _model_future
 
-# --- 1) Load Story ---
-try:
-    with open(STORY_FILE, "r", encoding="utf-8") as f:
-        story_text = f.read().strip()
-except FileNotFoundError:
-    print(f"❌ Error: {STORY_FILE} not found!")
-    exit(1)
 
-lines = story_text.split("\n", 1)
-story_title = lines[0][:23]
-story_body = lines[1] if len(lines) > 1 else ""
+def load_voice_async():
+    """Start loading the Piper voice once per process; later jobs reuse the same future."""
+    global _voice_future
+    if _voice_future is None:
+        _voice_future = _pool.submit(load_voice)
+    return _voice_future
 
-print("✅ Story loaded:", story_title)
 
-# --- 2) Generate Narration (title + body) ---
-try:
-    tts_title = gTTS(story_title, lang="en")
-    tts_title.save(TITLE_AUDIO)
-
-    if story_body:
-        tts_body = gTTS(story_body, lang="en")
-        tts_body.save(BODY_AUDIO)
-
-    concat_cmd = [
-        "ffmpeg", "-y",
-        "-i", TITLE_AUDIO,
-        "-i", BODY_AUDIO if story_body else TITLE_AUDIO,
-        "-filter_complex", "[0:a][1:a]concat=n=2:v=0:a=1[aout]" if story_body else "[0:a][0:a]concat=n=2:v=0:a=1[aout]",
-        "-map", "[aout]",
-        OUTPUT_AUDIO
-    ]
-    subprocess.run(concat_cmd, check=True)
-
-    # Duration of the title clip (for subtitle skipping)
-    duration_cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        TITLE_AUDIO
-    ]
-    title_duration = float(subprocess.check_output(duration_cmd).decode().strip())
-
-    print("✅ Narration saved as", OUTPUT_AUDIO)
-except Exception as e:
-    print(f"❌ Error generating narration: {str(e)}")
-    exit(1)
-
-# --- 3) Transcribe to ASS karaoke subs ---
-try:
-    model = whisper.load_model("small.en")
-    result = model.transcribe(OUTPUT_AUDIO, word_timestamps=True)  # per-word timing
-    save_ass_subs(result, SUBTITLE_FILE, title_duration)
-    print("✅ Subtitles saved as", SUBTITLE_FILE)
-except Exception as e:
-    print(f"❌ Error generating subtitles: {str(e)}")
-    exit(1)
-
-# --- 4) Pick PNG ---
-png_files = glob.glob(os.path.join(IMAGE_FOLDER, "*.png"))
-if not png_files:
-    print(f"❌ Error: No PNG files found in {IMAGE_FOLDER}.")
-    exit(1)
-TITLE_IMAGE = max(png_files, key=os.path.getmtime)
-print("✅ Using PNG:", TITLE_IMAGE)
-
-# --- 5) Pick Background Video ---
-try:
-    bg_video = random.choice([
-        os.path.join(BACKGROUND_FOLDER, f)
-        for f in os.listdir(BACKGROUND_FOLDER)
-        if f.endswith(".mp4")
-    ])
-    print("🎥 Using background video:", bg_video)
-except FileNotFoundError:
-    print(f"❌ Error: No .mp4 files found in {BACKGROUND_FOLDER}")
-    exit(1)
-
-# --- 6) Merge with FFmpeg ---
-subtitle_path = os.path.abspath(SUBTITLE_FILE).replace("\\", "/").replace(":", r"\\:")
-font_dir = os.path.abspath(FONT_FOLDER).replace("\\", "/").replace(":", r"\\:")
-
-cmd = [
-    "ffmpeg", "-y", "-loglevel", "debug",
-    "-i", bg_video,
-    "-i", OUTPUT_AUDIO,
-    "-i", TITLE_IMAGE,
-    "-filter_complex",
-    f"[0:v]scale=iw*max(1080/iw\\,1920/ih):ih*max(1080/iw\\,1920/ih),crop=1080:1920[v0];"
-    f"[2:v]scale={OVERLAY_SCALE}[v2];"
-    f"[v0][v2]overlay=(main_w-overlay_w)/2:{OVERLAY_Y_POSITION}:enable='between(t,0,{title_duration})':format=auto[vout];"
-    f"[vout]subtitles=filename={subtitle_path}:fontsdir={font_dir}[vfinal]",
-    "-map", "[vfinal]",
-    "-map", "1:a",
-    "-shortest",
-    "-c:v", "libx264",
-    "-c:a", "aac",
-    "-b:a", "192k",
-    "-ar", "44100",
-    "-pix_fmt", "yuv420p",
-    OUTPUT_VIDEO
-]
+def get_model():
+    """Block until the Whisper model is loaded and return it."""
+    return load_model_async().result()
 
-try:
-    subprocess.run(cmd, check=True)
-    print("✅ Final video saved as", OUTPUT_VIDEO)
-except subprocess.CalledProcessError as e:
-    print(f"❌ Error in FFmpeg processing: {str(e)}")
-    exit(1)
 
-# --- 7) Cleanup ---
-try:
-    os.remove(TITLE_AUDIO)
-    if story_body:
-        os.remove(BODY_AUDIO)
-    os.remove(SUBTITLE_FILE)
-except:
-    pass
+def warm_up(model):
+    """Run one tiny transcription so CTranslate2's one-time kernel/allocator setup isn't paid by the first job."""
+    silence = np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32)
+    segments, _info = model.transcribe(silence, vad_filter=False)
+    for _ in segments:  # generator: force the encoder/decoder to run
+        pass
+
+
+def cache_key(story_title, story_body):
+    """Hash of everything that determines the narration and the transcript."""
+    h = hashlib.blake2b(digest_size=16)
+    for part in (story_title, story_body, PIPER_VOICE, WHISPER_MODEL, *whisper_device(),
+                 str(WHISPER_BEAM_SIZE), str(VAD_MIN_SILENCE_MS)):
+        h.update(part.encode("utf-8") + b"\x00")
+    return h.hexdigest()
+
+
+def load_cached(cache_dir, has_body):
+    """
+    Return (result, title_duration) from a complete cache entry, or None on a miss.
+    A corrupt/stale result.pkl or a missing narration WAV also counts as a miss.
+    """
+    wavs = [TITLE_AUDIO, BODY_AUDIO] if has_body else [TITLE_AUDIO]
+    if not all(os.path.exists(os.path.join(cache_dir, name)) for name in wavs):
+        return None
+    try:
+        with open(os.path.join(cache_dir, "result.pkl"), "rb") as f:
+            result, title_duration = pickle.load(f)
+    except Exception:  # missing, truncated, or written by an incompatible version
+        return None
+    return result, title_duration
+
+
+def store_cached(cache_dir, audio_paths, result, title_duration):
+    """Copy the narration clips into the cache; result.pkl is written last and marks the entry complete."""
+    os.makedirs(cache_dir, exist_ok=True)
+    for path in audio_paths:
+        dest = os.path.join(cache_dir, os.path.basename(path))
+        shutil.copyfile(path, dest + ".part")
+        os.replace(dest + ".part", dest)
+    tmp = os.path.join(cache_dir, "result.pkl.part")
+    with open(tmp, "wb") as f:
+        pickle.dump((result, title_duration), f)
+    os.replace(tmp, os.path.join(cache_dir, "result.pkl"))
+
+
+# One job per stage at a time: with several jobs in flight, job N renders while
+# job N+1 transcribes and job N+2 synthesizes. All three stages are CPU-bound and
+# each sizes its threads to the whole machine (Piper/ONNX Runtime, CTranslate2,
+# x264), so they compete for the same cores; the overlap mainly fills the gaps
+# each stage leaves (serial decoder steps, file IO, single-threaded subtitle
+# rendering) rather than giving a 3x speedup.
+Stages = collections.namedtuple("Stages", "tts whisper render")
+
+
+def new_stages():
+    """One-slot semaphore per stage. Call from inside the running loop (Python 3.9 binds at creation)."""
+    return Stages(asyncio.Semaphore(1), asyncio.Semaphore(1), asyncio.Semaphore(1))
+
+
+async def process(story_path, stages, output_video=OUTPUT_VIDEO):
+    """Turn one story file into a finished video. Returns True on success."""
+    # --- 1) Load Story ---
+    try:
+        with open(story_path, "r", encoding="utf-8") as f:
+            story_text = f.read().strip()
+    except FileNotFoundError:
+        print(f"❌ Error: {story_path} not found!")
+        return False
+
+    lines = story_text.split("\n", 1)
+    story_title = lines[0][:23]
+    story_body = lines[1] if len(lines) > 1 else ""
+
+    print("✅ Story loaded:", story_title)
+
+    # Intermediate files are per job so pipelined jobs don't overwrite each other;
+    # the directory is removed on exit (this replaces the old cleanup step)
+    with tempfile.TemporaryDirectory(prefix="story_") as work_dir:
+        title_audio = os.path.join(work_dir, TITLE_AUDIO)
+        body_audio = os.path.join(work_dir, BODY_AUDIO)
+        subtitle_file = os.path.join(work_dir, SUBTITLE_FILE)
+
+        # Same text (and same voice/model settings) -> same narration and transcript,
+        # so a cache hit skips TTS and Whisper entirely
+        cache_dir = os.path.join(CACHE_FOLDER, cache_key(story_title, story_body))
+        cached = await asyncio.to_thread(load_cached, cache_dir, bool(story_body))
+        if cached is not None:
+            result, title_duration = cached
+            title_audio = os.path.join(cache_dir, TITLE_AUDIO)
+            body_audio = os.path.join(cache_dir, BODY_AUDIO)
+            print("♻️ Using cached narration and transcript for", story_title)
+
+        # --- 2) Generate Narration (title + body) ---
+        if cached is None:
+            model_future = load_model_async()  # loads while TTS runs below
+            voice_future = load_voice_async()
+            try:
+                async with stages.tts:
+                    voice = await asyncio.wrap_future(voice_future)
+                    tts_futures = [_pool.submit(synth, voice, story_title, title_audio)]
+                    if story_body:
+                        tts_futures.append(_pool.submit(synth, voice, story_body, body_audio))
+                    await asyncio.gather(*map(asyncio.wrap_future, tts_futures))  # re-raises any TTS error
+                print("✅ Narration saved for", story_title)
+            except Exception as e:
+                print(f"❌ Error generating narration: {str(e)}")
+                return False
+
+        # --- 3) Transcribe to ASS karaoke subs ---
+        try:
+            if cached is None:
+                async with stages.whisper:
+                    model = await asyncio.wrap_future(model_future)
+                    # No joined narration file: Whisper gets the clips concatenated in memory
+                    # and ffmpeg concatenates them itself in the final render
+                    title_pcm = await asyncio.to_thread(load_audio, title_audio)
+                    audio = title_pcm
+                    if story_body:
+                        audio = np.concatenate([title_pcm, await asyncio.to_thread(load_audio, body_audio)])
+                    # Duration of the title clip (for subtitle skipping), from its PCM length
+                    title_duration = len(title_pcm) / WHISPER_SAMPLE_RATE
+                    result = await asyncio.to_thread(transcribe_words, model, audio)  # per-word timing
+
+                try:
+                    await asyncio.to_thread(store_cached, cache_dir,
+                                            [title_audio, body_audio] if story_body else [title_audio],
+                                            result, title_duration)
+                except OSError as e:
+                    print(f"⚠️ Could not cache narration/transcript: {str(e)}")
+            await asyncio.to_thread(save_ass_subs, result, subtitle_file, title_duration)
+            print("✅ Subtitles saved for", story_title)
+        except Exception as e:
+            print(f"❌ Error generating subtitles: {str(e)}")
+            return False
+
+        # --- 4) Pick PNG ---
+        # scandir entries cache their stat(), so this is one pass with one stat per file
+        newest = None
+        try:
+            with os.scandir(IMAGE_FOLDER) as it:
+                for entry in it:
+                    if entry.name.endswith(".png") and (
+                            newest is None or entry.stat().st_mtime > newest.stat().st_mtime):
+                        newest = entry
+        except FileNotFoundError:
+            pass
+        if newest is None:
+            print(f"❌ Error: No PNG files found in {IMAGE_FOLDER}.")
+            return False
+        TITLE_IMAGE = newest.path
+        print("✅ Using PNG:", TITLE_IMAGE)
+        try:
+            overlay_image = await asyncio.to_thread(prescale_overlay, TITLE_IMAGE,
+                                                    os.path.join(work_dir, OVERLAY_IMAGE))
+        except OSError as e:  # includes PIL.UnidentifiedImageError
+            print(f"❌ Error reading title image {TITLE_IMAGE}: {str(e)}")
+            return False
+
+        # --- 5) Pick Background Video ---
+        try:
+            with os.scandir(BACKGROUND_FOLDER) as it:
+                bg_videos = [
+                    entry.path for entry in it
+                    if entry.name.endswith(".mp4") and not entry.name.endswith(BG_CROPPED_SUFFIX)
+                ]
+            bg_video = random.choice(bg_videos)
+            print("🎥 Using background video:", bg_video)
+        except (FileNotFoundError, IndexError):
+            print(f"❌ Error: No .mp4 files found in {BACKGROUND_FOLDER}")
+            return False
+
+        # --- 6) Merge with FFmpeg ---
+        subtitle_path = os.path.abspath(subtitle_file).replace("\\", "/").replace(":", r"\\:")
+        font_dir = os.path.abspath(FONT_FOLDER).replace("\\", "/").replace(":", r"\\:")
+
+        async with stages.render:
+            try:
+                # Inside the render stage so two jobs never build the same cached crop at once
+                bg_video = await asyncio.to_thread(cropped_background, bg_video)
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Error pre-cropping background: {str(e)}")
+                return False
+            encoder_args = await asyncio.to_thread(video_encoder_args)  # first call probes ffmpeg
+
+            # Inputs: 0 = background, 1 = title narration, [2 = body narration], last = overlay PNG
+            audio_inputs = ["-i", title_audio] + (["-i", body_audio] if story_body else [])
+            image_idx = 1 + len(audio_inputs) // 2
+            audio_concat = "[1:a][2:a]concat=n=2:v=0:a=1[aout];" if story_body else ""
+
+            cmd = [
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-i", bg_video,
+                *audio_inputs,
+                "-i", overlay_image,
+                "-filter_complex",
+                f"{audio_concat}"
+                f"[0:v][{image_idx}:v]overlay=(main_w-overlay_w)/2:{OVERLAY_Y_POSITION}:enable='between(t,0,{title_duration})':format=auto[vout];"
+                f"[vout]subtitles=filename={subtitle_path}:fontsdir={font_dir}[vfinal]",
+                "-map", "[vfinal]",
+                "-map", "[aout]" if story_body else "1:a",
+                "-shortest",
+                *encoder_args,
+                "-c:a", "aac",
+                "-b:a", "192k",
+                "-ar", "44100",
+                "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart",  # moov atom up front so uploads can start playing immediately
+                output_video
+            ]
+
+            proc = await asyncio.create_subprocess_exec(*cmd)
+            if await proc.wait() != 0:
+                print(f"❌ Error in FFmpeg processing: exit status {proc.returncode}")
+                return False
+            print("✅ Final video saved as", output_video)
+
+    return True
+
+
+def output_for(story_path):
+    """Video path for a story rendered in batch/serve mode: stories/foo.txt -> stories/foo.mp4."""
+    return os.path.splitext(story_path)[0] + ".mp4"
+
+
+async def run_jobs(story_paths):
+    """Render several stories as a pipeline. Returns True if every job succeeded."""
+    stages = new_stages()
+    if len(story_paths) == 1:
+        return await process(story_paths[0], stages)
+    # return_exceptions: one crashing story must not cancel the others in flight
+    results = await asyncio.gather(*(process(p, stages, output_for(p)) for p in story_paths),
+                                   return_exceptions=True)
+    for story_path, res in zip(story_paths, results):
+        if isinstance(res, BaseException):
+            print(f"❌ Unexpected error rendering {story_path}: {res!r}")
+    return all(res is True for res in results)
+
+
+def _report_job(story_path, task):
+    """Done-callback for serve jobs: surface exceptions that escaped process()."""
+    if not task.cancelled() and task.exception() is not None:
+        print(f"❌ Unexpected error rendering {story_path}: {task.exception()!r}")
+
+
+async def drain(jobs):
+    """Pipeline story paths from the queue until a None arrives, then finish what's in flight."""
+    stages = new_stages()
+    in_flight = set()
+    while True:
+        story_path = await asyncio.to_thread(jobs.get)
+        if story_path is None:
+            break
+        task = asyncio.create_task(process(story_path, stages, output_for(story_path)))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        task.add_done_callback(functools.partial(_report_job, story_path))
+    if in_flight:
+        await asyncio.wait(in_flight)
+
+
+def worker(jobs, ready):
+    """Load the model once, then render every story path put on the queue (None stops)."""
+    try:
+        warm_up(get_model())
+    except Exception as e:
+        print(f"❌ Error loading Whisper model: {str(e)}")
+        sys.exit(1)
+    ready.set()
+    print("✅ Whisper model loaded, waiting for jobs")
+    asyncio.run(drain(jobs))
+
+
+def serve():
+    """
+    Read story paths from stdin, one per line, and hand them to a persistent worker.
+    Returns False if the worker died (model load failure or crash) instead of queueing into the void.
+    """
+    jobs = multiprocessing.Queue()
+    ready = multiprocessing.Event()
+    proc = multiprocessing.Process(target=worker, args=(jobs, ready))
+    proc.start()
+
+    # Readiness handshake: don't accept jobs until the model is loaded
+    while not ready.wait(timeout=1.0):
+        if not proc.is_alive():
+            print("❌ Error: worker exited before the Whisper model was ready")
+            return False
+
+    try:
+        for line in sys.stdin:
+            story_path = line.strip()
+            if not story_path:
+                continue
+            if not proc.is_alive():
+                print(f"❌ Error: worker exited (code {proc.exitcode}); not queueing {story_path}")
+                jobs.cancel_join_thread()  # nobody will read what's still buffered
+                return False
+            jobs.put(story_path)
+    finally:
+        if proc.is_alive():
+            jobs.put(None)
+        proc.join()
+    return proc.exitcode == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Turn a Reddit story into a narrated video.")
+    parser.add_argument("--serve", action="store_true",
+                        help="keep Whisper loaded and render story paths read from stdin")
+    parser.add_argument("--job", nargs="+", default=[STORY_FILE],
+                        help=f"story file(s) to render (default: {STORY_FILE}); with several, "
+                             f"each is written next to its story as <name>.mp4")
+    args = parser.parse_args()
+
+    if args.serve:
+        exit(0 if serve() else 1)
+    else:
+        exit(0 if asyncio.run(run_jobs(args.job)) else 1)